@@ -7,11 +7,13 @@ from fastapi.responses import JSONResponse
 from fastapi import WebSocket
 from fastapi.responses import HTMLResponse
 from typing import List
-import subprocess, os, traceback
+import subprocess, os, traceback, time
 import asyncio
+from contextlib import asynccontextmanager
 import folder_utils as fu
 import watchdog_manager as wd
 import db_utils as db
+import tracing_utils as tr
 
 # -----------------------
 # Logging Configuration
@@ -30,7 +32,12 @@ logger.addHandler(console_handler)
 # -----------------------
 # FastAPI App
 # -----------------------
-app = FastAPI(title="Stream Control API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db.init_db()
+    yield
+
+app = FastAPI(title="Stream Control API", lifespan=lifespan)
 
 # Define the allowed origins as a wildcard to allow all
 origins = ["*", "http://192.168.55.106:8080", "http://127.0.0.1:8080"]
@@ -43,6 +50,10 @@ app.add_middleware(
     allow_headers=["*"],     # Allows all request headers
 )
 
+# Per-route latency histograms (only installed when STREAM_TRACING=1)
+if tr.TRACING_ENABLED:
+    app.add_middleware(tr.RouteLatencyMiddleware)
+
 def start_stream_process(record, db_session):
     # command = [
     #     "ffmpeg", "-i", record.url, "-c:v", "copy", "-c:a", "aac", "-ac", "1",
@@ -59,38 +70,51 @@ def start_stream_process(record, db_session):
         "-hls_allow_cache", "0", "-hls_segment_filename", f"/var/www/html/bsghelp/streams/{record.name}/segment_%03d.ts",
         f"/var/www/html/bsghelp/streams/{record.name}/{record.name}.m3u8"
     ]
-    process = subprocess.Popen(command)
-    record.pid = process.pid
-    db_session.commit()
-    db_session.refresh(record)
     folder_path = f"/var/www/html/bsghelp/streams/{record.name}"
-    wd.start_watchdog(process.pid, folder_path, restart_stream_by_pid)
+    with tr.span("start_stream.popen", record_id=record.id):
+        launched_at = time.perf_counter()
+        process = subprocess.Popen(command)
+    tr.track_first_segment(record.name, folder_path, launched_at)
+    record.pid = process.pid
+    with tr.span("start_stream.db_commit", record_id=record.id):
+        db_session.commit()
+    with tr.span("start_stream.db_refresh", record_id=record.id):
+        db_session.refresh(record)
+    with tr.span("start_stream.watchdog_spawn", record_id=record.id):
+        wd.start_watchdog(process.pid, folder_path, restart_stream_by_pid)
     logger.info(f"Started stream for record {record.id} (PID: {process.pid})")
     return process.pid
 
 
 def stop_stream_process(pid, db_session):
-    wd.stop_watchdog(pid)
+    with tr.span("stop_stream.watchdog_stop", pid=pid):
+        wd.stop_watchdog(pid)
     try:
-        os.kill(pid, 9)
+        with tr.span("stop_stream.kill", pid=pid):
+            os.kill(pid, 9)
         delete_files_in_directory(pid)
     except ProcessLookupError:
         logger.warning(f"PID {pid} not found (already stopped)")
-    record = db_session.query(db.Record).filter(db.Record.pid == pid).first()
+    with tr.span("stop_stream.db_lookup", pid=pid):
+        record = db_session.query(db.Record).filter(db.Record.pid == pid).first()
     if record:
         record.pid = None
-        db_session.commit()
-        db_session.refresh(record)
+        with tr.span("stop_stream.db_commit", pid=pid):
+            db_session.commit()
+        with tr.span("stop_stream.db_refresh", pid=pid):
+            db_session.refresh(record)
     logger.info(f"Stopped stream PID {pid}")
     return
 
 def restart_stream_process(record, db_session):
     try:
         if record.pid:
-            stop_stream_process(record.pid, db_session)
+            with tr.span("restart_stream.stop", record_id=record.id):
+                stop_stream_process(record.pid, db_session)
             logger.info("Stream stopped successfully.")
             delete_files_in_directory(record.pid)
-        pid = start_stream_process(record, db_session)
+        with tr.span("restart_stream.start", record_id=record.id):
+            pid = start_stream_process(record, db_session)
         logger.info(f"Restarted stream for record ID {record.id}")
         return {"message": f"Restarted stream for record ID {record.id}", "pid": record.pid}
     except Exception as e:
@@ -181,6 +205,20 @@ def restart_stream(record_id: int, db_session=Depends(db.get_db)):
     restart_stream_process(record, db_session)
     return {"message": f"Restarted stream for record ID {record_id}", "pid": record.pid}
 
+@app.get("/stream_status/{record_id}")
+def stream_status(record_id: int, db_session=Depends(db.get_db)):
+    record = db.get_record_by_id(record_id, db_session)
+    status = wd.get_stream_status(record.pid) if record.pid else None
+    return {"id": record.id, "name": record.name, "pid": record.pid,
+            "status": status or {"state": "stopped" if not record.pid else "unmonitored"}}
+
+# -----------------------
+# Tracing Endpoint
+# -----------------------
+@app.get("/tracing")
+def get_tracing():
+    return tr.get_snapshot()
+
 #---------------------------------------
 #	Websockets
 #---------------------------------------
@@ -216,11 +254,13 @@ def delete_files_in_directory(pid: int):
     Keeps the directory and any subdirectories.
     """
     # --- Get DB session ---
-    db_session = next(db.get_db())
+    with tr.span("delete_files.db_session", pid=pid):
+        db_session = next(db.get_db())
 
     try:
         # --- Get the record from PID ---
-        record = db_session.query(db.Record).filter(db.Record.pid == pid).first()
+        with tr.span("delete_files.db_lookup", pid=pid):
+            record = db_session.query(db.Record).filter(db.Record.pid == pid).first()
         if not record:
             print(f"No record found for PID {pid}")
             return
@@ -233,14 +273,15 @@ def delete_files_in_directory(pid: int):
             return
 
         # --- Delete files ---
-        for filename in os.listdir(directory_path):
-            file_path = os.path.join(directory_path, filename)
-            if os.path.isfile(file_path):
-                try:
-                    os.remove(file_path)
-                    print(f"Deleted: {file_path}")
-                except OSError as e:
-                    print(f"Error deleting {file_path}: {e}")
+        with tr.span("delete_files.remove", pid=pid):
+            for filename in os.listdir(directory_path):
+                file_path = os.path.join(directory_path, filename)
+                if os.path.isfile(file_path):
+                    try:
+                        os.remove(file_path)
+                        print(f"Deleted: {file_path}")
+                    except OSError as e:
+                        print(f"Error deleting {file_path}: {e}")
 
         print(f"All files deleted in: {directory_path}")
 
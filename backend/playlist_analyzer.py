@@ -0,0 +1,334 @@
+import os
+import time
+import hashlib
+import statistics
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger("stream_api")
+
+# -----------------------
+# Analyzer Configuration
+# -----------------------
+# Only this many bytes from the end of the playlist are parsed on each check
+PLAYLIST_TAIL_BYTES = 4096
+
+# No new segment for this many target durations → stalled. With -c:v copy,
+# ffmpeg can only cut on keyframes, so long-GOP cameras get long segments.
+STALL_TARGET_DURATIONS = 3
+MIN_STALL_TIMEOUT = 10  # seconds
+
+# Grace period after launch before the first segment must appear. Must stay
+# above ffmpeg's own RTSP -timeout (50 s in main.py).
+STARTUP_GRACE = 75  # seconds
+
+# PROGRAM-DATE-TIME lag growing by more than this within PDT_WINDOW → stalled.
+# Only growth counts: ffmpeg's PDT carries a constant offset (launch time,
+# append_list), and slow camera clock drift is rebased away by the window.
+PDT_DRIFT_LIMIT = 30  # seconds
+PDT_WINDOW = 120  # seconds
+
+# This many consecutive duplicate or tiny segments → frozen feed
+FROZEN_SEGMENT_COUNT = 3
+
+# Segments whose video bytes/s fall below this fraction of the stream's own
+# median (over recent healthy segments) are "tiny". Audio is excluded, so the
+# AAC track does not mask a frozen picture, and the cutoff scales with the
+# camera: a frozen main stream still sends a keyframe per segment.
+FROZEN_BITRATE_RATIO = 0.25
+BITRATE_BASELINE_SEGMENTS = 30
+MIN_BASELINE_SEGMENTS = 3
+
+# How many recent segments to keep stats for
+SEGMENT_HISTORY = 10
+
+# -----------------------
+# MPEG-TS Scanning
+# -----------------------
+TS_PACKET_SIZE = 188
+TS_READ_PACKETS = 4096
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24}  # MPEG-1/2, MPEG-4, H.264, HEVC
+
+def _psi_section(payload, unit_start: bool):
+    """Return the PSI section carried in a TS payload, or None."""
+    if not unit_start or len(payload) < 1:
+        return None
+    section = payload[1 + payload[0]:]
+    if len(section) < 3:
+        return None
+    section_length = ((section[1] & 0x0F) << 8) | section[2]
+    return section[:3 + section_length - 4]  # drop CRC32
+
+def _parse_pat(section) -> int:
+    for i in range(8, len(section) - 3, 4):
+        program_number = (section[i] << 8) | section[i + 1]
+        if program_number != 0:
+            return ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+    return None
+
+def _parse_pmt(section) -> int:
+    if len(section) < 12:
+        return None
+    i = 12 + (((section[10] & 0x0F) << 8) | section[11])
+    while i + 5 <= len(section):
+        stream_type = section[i]
+        pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+        if stream_type in VIDEO_STREAM_TYPES:
+            return pid
+        i += 5 + (((section[i + 3] & 0x0F) << 8) | section[i + 4])
+    return None
+
+def _strip_pes_header(payload):
+    if len(payload) < 9 or payload[0:3] != b"\x00\x00\x01":
+        return payload
+    return payload[9 + payload[8]:]
+
+def scan_segment(path: str):
+    """
+    Return (video_bytes, digest) for an MPEG-TS segment, counting and hashing
+    only the video elementary stream: TS headers, adaptation fields (PCR) and
+    PES headers (PTS/DTS) are skipped, so re-muxed identical pictures hash the
+    same. Returns (None, None) if the file is gone or carries no video.
+    """
+    pmt_pid = None
+    video_pid = None
+    video_bytes = 0
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(TS_PACKET_SIZE * TS_READ_PACKETS)
+                if not chunk:
+                    break
+                view = memoryview(chunk)
+                for offset in range(0, len(chunk) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+                    packet = view[offset:offset + TS_PACKET_SIZE]
+                    if packet[0] != 0x47:
+                        continue
+                    unit_start = bool(packet[1] & 0x40)
+                    pid = ((packet[1] & 0x1F) << 8) | packet[2]
+                    adaptation = (packet[3] >> 4) & 0x03
+                    start = 4 + (1 + packet[4] if adaptation & 0x02 else 0)
+                    if not adaptation & 0x01 or start >= TS_PACKET_SIZE:
+                        continue
+                    payload = packet[start:]
+
+                    if pid == video_pid:
+                        if unit_start:
+                            payload = _strip_pes_header(payload)
+                        digest.update(payload)
+                        video_bytes += len(payload)
+                    elif pid == 0 and pmt_pid is None:
+                        section = _psi_section(payload, unit_start)
+                        pmt_pid = _parse_pat(section) if section else None
+                    elif pid == pmt_pid and video_pid is None:
+                        section = _psi_section(payload, unit_start)
+                        video_pid = _parse_pmt(section) if section else None
+    except FileNotFoundError:
+        return None, None
+
+    if video_pid is None:
+        return None, None
+    return video_bytes, digest.hexdigest()
+
+def _parse_program_date_time(value: str):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+class PlaylistAnalyzer:
+    """
+    Incrementally analyze an HLS playlist for stalls and frozen feeds.
+
+    Each check() reads only the tail of the playlist, and only scans segments
+    written since the analyzer was created; entries left over from an earlier
+    run are ignored. check() and status() may be called from different threads.
+
+    bitrate_history holds the video bytes/s of recent healthy segments; pass the
+    same deque to the analyzer of a restarted stream to keep its baseline.
+    """
+
+    def __init__(self, playlist_path: str, started_at: float = None, bitrate_history: deque = None):
+        self.playlist_path = playlist_path
+        self.folder_path = os.path.dirname(playlist_path)
+        self.started_at = started_at or time.time()
+
+        self._lock = threading.Lock()
+        self._last_stat = None
+        self._seen_uris = deque(maxlen=SEGMENT_HISTORY * 2)
+        self._segments = deque(maxlen=SEGMENT_HISTORY)
+        self._pdt_samples = deque()  # (observed_at, drift)
+        self._bitrate_history = bitrate_history if bitrate_history is not None else deque(maxlen=BITRATE_BASELINE_SEGMENTS)
+
+        self.media_sequence = None
+        self.target_duration = None
+        self.last_segment_uri = None
+        self.last_progress = None
+        self.frozen_streak = 0
+        self.state = "starting"
+        self.reason = None
+
+    def _read_tail(self) -> list:
+        with open(self.playlist_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            offset = max(0, size - PLAYLIST_TAIL_BYTES)
+            f.seek(offset)
+            data = f.read().decode("utf-8", errors="replace")
+        lines = data.splitlines()
+        if offset > 0 and lines:
+            lines = lines[1:]  # first line is probably cut in half
+        return lines
+
+    def _parse(self, lines: list) -> list:
+        """Return (uri, duration, program_date_time) for each complete segment entry in the tail."""
+        entries = []
+        duration = None
+        pdt = None
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                try:
+                    self.media_sequence = int(line.split(":", 1)[1])
+                except ValueError:
+                    pass
+            elif line.startswith("#EXT-X-TARGETDURATION:"):
+                try:
+                    self.target_duration = float(line.split(":", 1)[1])
+                except ValueError:
+                    pass
+            elif line.startswith("#EXTINF:"):
+                try:
+                    duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+                except ValueError:
+                    duration = None
+            elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+                pdt = _parse_program_date_time(line.split(":", 1)[1])
+            elif not line.startswith("#"):
+                # A URI without its #EXTINF was cut off at the start of the tail
+                if duration is not None:
+                    entries.append((line, duration, pdt))
+                duration = None
+                pdt = None
+        return entries
+
+    def _record_segment(self, uri: str, duration: float, pdt, now: float) -> bool:
+        """Analyze a segment not seen before. Returns False if it predates this run."""
+        path = os.path.join(self.folder_path, uri)
+        try:
+            if os.path.getmtime(path) < self.started_at:
+                return False
+        except FileNotFoundError:
+            return False  # already rotated out, so not written by this run
+
+        video_bytes, digest = scan_segment(path)
+        if video_bytes is None:
+            self.frozen_streak = 0
+        else:
+            previous = self._segments[-1] if self._segments else None
+            is_duplicate = previous is not None and digest == previous["digest"]
+            rate = video_bytes / max(duration, 0.001)
+            baseline = self.bitrate_baseline()
+            is_tiny = baseline is not None and rate < FROZEN_BITRATE_RATIO * baseline
+            if is_duplicate or is_tiny:
+                self.frozen_streak += 1
+            else:
+                self.frozen_streak = 0
+                self._bitrate_history.append(rate)
+
+        self._segments.append({"uri": uri, "duration": duration, "video_bytes": video_bytes, "digest": digest})
+
+        if pdt is not None:
+            self._pdt_samples.append((now, now - (pdt + duration)))
+            while len(self._pdt_samples) > 1 and now - self._pdt_samples[0][0] > PDT_WINDOW:
+                self._pdt_samples.popleft()
+        return True
+
+    def bitrate_baseline(self):
+        """Median video bytes/s of recent healthy segments, or None until there are enough."""
+        if len(self._bitrate_history) < MIN_BASELINE_SEGMENTS:
+            return None
+        return statistics.median(self._bitrate_history)
+
+    def stall_timeout(self) -> float:
+        """How long without a new segment counts as a stall, from the playlist's own durations."""
+        longest = max([self.target_duration or 0] + [s["duration"] for s in self._segments])
+        if not longest:
+            return STARTUP_GRACE
+        return max(STALL_TARGET_DURATIONS * longest, MIN_STALL_TIMEOUT)
+
+    def pdt_drift_growth(self):
+        """How much the PROGRAM-DATE-TIME lag behind wall clock grew within PDT_WINDOW."""
+        if not self._pdt_samples:
+            return None
+        return self._pdt_samples[-1][1] - self._pdt_samples[0][1]
+
+    def check(self, now: float = None) -> str:
+        """Re-read the playlist tail and update state. Returns the new state."""
+        now = now or time.time()
+        with self._lock:
+            try:
+                stat = os.stat(self.playlist_path)
+            except FileNotFoundError:
+                stat = None
+
+            if stat is not None and (stat.st_mtime_ns, stat.st_size) != self._last_stat:
+                self._last_stat = (stat.st_mtime_ns, stat.st_size)
+                for uri, duration, pdt in self._parse(self._read_tail()):
+                    if uri in self._seen_uris:
+                        continue
+                    self._seen_uris.append(uri)
+                    if self._record_segment(uri, duration, pdt, now):
+                        self.last_segment_uri = uri
+                        self.last_progress = now
+
+            if self.last_progress is None:
+                if now - self.started_at > STARTUP_GRACE:
+                    reason = "playlist missing" if stat is None else "no segment since launch"
+                    self.state, self.reason = "stalled", f"{reason} after {STARTUP_GRACE}s"
+                return self.state
+
+            since_progress = now - self.last_progress
+            stall_timeout = self.stall_timeout()
+            pdt_growth = self.pdt_drift_growth()
+
+            if since_progress > stall_timeout:
+                self.state, self.reason = "stalled", f"no new segment for {since_progress:.0f}s (limit {stall_timeout:.0f}s)"
+            elif pdt_growth is not None and pdt_growth > PDT_DRIFT_LIMIT:
+                self.state, self.reason = "stalled", f"program date time fell {pdt_growth:.0f}s further behind wall clock"
+            elif self.frozen_streak >= FROZEN_SEGMENT_COUNT:
+                self.state, self.reason = "frozen", f"{self.frozen_streak} duplicate or low-bitrate video segments in a row"
+            else:
+                self.state, self.reason = "healthy", None
+            return self.state
+
+    @property
+    def unhealthy(self) -> bool:
+        return self.state in ("stalled", "frozen")
+
+    def status(self) -> dict:
+        """Return the latest analysis as a JSON-serialisable dict."""
+        with self._lock:
+            pdt_growth = self.pdt_drift_growth()
+            baseline = self.bitrate_baseline()
+            return {
+                "state": self.state,
+                "reason": self.reason,
+                "media_sequence": self.media_sequence,
+                "target_duration": self.target_duration,
+                "stall_timeout": self.stall_timeout(),
+                "last_segment": self.last_segment_uri,
+                "seconds_since_progress": round(time.time() - self.last_progress, 1) if self.last_progress else None,
+                "pdt_drift": round(self._pdt_samples[-1][1], 1) if self._pdt_samples else None,
+                "pdt_drift_growth": round(pdt_growth, 1) if pdt_growth is not None else None,
+                "frozen_streak": self.frozen_streak,
+                "video_bitrate_baseline": round(baseline) if baseline is not None else None,
+                "recent_segments": [
+                    {"uri": s["uri"], "duration": s["duration"], "video_bytes": s["video_bytes"]} for s in self._segments
+                ],
+            }
@@ -0,0 +1,82 @@
+import importlib
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import db_utils
+import migrate_db
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    """db_utils configured for a fresh SQLite file."""
+    monkeypatch.setenv("STREAM_DB_BACKEND", "sqlite")
+    monkeypatch.setenv("STREAM_SQLITE_PATH", str(tmp_path / "streams.db"))
+    monkeypatch.delenv("STREAM_DB_URL", raising=False)
+    module = importlib.reload(db_utils)
+    module.init_db()
+    yield module
+    module.engine.dispose()
+    module.read_engine.dispose()
+
+def test_sqlite_uses_wal(db):
+    with db.read_engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+
+def test_read_after_flush_sees_uncommitted_row(db):
+    session = db.SessionLocal()
+    record = db.create_record(db.RecordCreate(url="rtsp://cam", name="original"), session)
+
+    record.name = "changed"
+    session.flush()
+    session.expire_all()
+    assert session.query(db.Record).filter(db.Record.id == record.id).one().name == "changed"
+
+    session.rollback()
+    assert session.get_bind() is db.read_engine
+    assert session.query(db.Record).filter(db.Record.id == record.id).one().name == "original"
+    session.close()
+
+def test_reads_outside_writes_use_reader(db):
+    session = db.SessionLocal()
+    db.get_all_records(session)
+    assert session.get_bind() is db.read_engine
+    session.close()
+
+def test_reader_connections_reject_writes(db):
+    with db.read_engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO streams (url, name) VALUES ('u', 'n')"))
+
+def test_many_concurrent_sessions_do_not_exhaust_reader_pool(db):
+    sessions = [db.SessionLocal() for _ in range(db.SQLITE_READER_POOL_SIZE + 7)]
+    try:
+        for session in sessions:
+            assert db.get_all_records(session) == []  # each one now holds a reader
+    finally:
+        for session in sessions:
+            session.close()
+
+def test_migrate_keeps_ids_and_clears_pids(db, tmp_path):
+    source_url = f"sqlite:///{tmp_path / 'source.db'}"
+    dest_url = f"sqlite:///{tmp_path / 'dest.db'}"
+    source_engine = create_engine(source_url)
+    db.Base.metadata.create_all(bind=source_engine)
+    with sessionmaker(bind=source_engine)() as source:
+        source.add_all([
+            db.Record(id=3, url="rtsp://a", name="a", pid=111),
+            db.Record(id=7, url="rtsp://b", name="b", pid=None),
+        ])
+        source.commit()
+
+    assert migrate_db.migrate(source_url, dest_url) == 2
+
+    with sessionmaker(bind=create_engine(dest_url))() as dest:
+        rows = [(r.id, r.name, r.pid) for r in dest.query(db.Record).order_by(db.Record.id)]
+    assert rows == [(3, "a", None), (7, "b", None)]
+
+    assert migrate_db.migrate(source_url, f"sqlite:///{tmp_path / 'keep.db'}", keep_pids=True) == 2
+    with sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'keep.db'}"))() as dest:
+        assert dest.query(db.Record).filter(db.Record.id == 3).one().pid == 111
@@ -0,0 +1,235 @@
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import pytest
+
+import playlist_analyzer as pa
+
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+PMT_PID = 0x1000
+
+# -----------------------
+# MPEG-TS / Playlist Builders
+# -----------------------
+def _ts_packet(pid: int, payload: bytes, unit_start: bool, cc: int, pcr: bool = False) -> bytes:
+    header = bytes([0x47, (0x40 if unit_start else 0) | (pid >> 8), pid & 0xFF])
+    adaptation = b""
+    if pcr:
+        adaptation = bytes([0x10]) + (cc * 1234).to_bytes(6, "big")
+    room = 184 - len(payload)
+    if adaptation or room > 0:
+        stuffing = room - 1 - len(adaptation)
+        if adaptation:
+            adaptation = adaptation + b"\xff" * stuffing
+        else:
+            adaptation = (b"\x00" + b"\xff" * (stuffing - 1)) if stuffing > 0 else b""
+        return header + bytes([0x30 | (cc & 0x0F), len(adaptation)]) + adaptation + payload
+    return header + bytes([0x10 | (cc & 0x0F)]) + payload
+
+def _psi(pid: int, table_id: int, body: bytes) -> bytes:
+    section = bytes([table_id, 0xB0 | ((len(body) + 4) >> 8), (len(body) + 4) & 0xFF]) + body + b"\x00" * 4
+    return _ts_packet(pid, b"\x00" + section, True, 0)
+
+def _pes_packets(pid: int, stream_id: int, es: bytes, pts: int, cc: int, pcr: bool) -> list:
+    pes = b"\x00\x00\x01" + bytes([stream_id, 0, 0, 0x80, 0x80, 5]) + pts.to_bytes(5, "big") + es
+    first = 184 - 8 if pcr else 184
+    chunks = [pes[:first]] + [pes[i:i + 184] for i in range(first, len(pes), 184)]
+    return [
+        _ts_packet(pid, chunk, i == 0, cc + i, pcr=pcr and i == 0)
+        for i, chunk in enumerate(chunks)
+    ]
+
+def make_segment(path: str, video_es: bytes, pts: int, audio_bytes: int = 0) -> None:
+    """Write a minimal MPEG-TS segment with one video PES and optional audio."""
+    pat = _psi(0, 0x00, b"\x00\x01\xc1\x00\x00" + b"\x00\x01" + bytes([0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]))
+    streams = bytes([0x1B, 0xE1, 0x00, 0xF0, 0x00, 0x0F, 0xE1, 0x01, 0xF0, 0x00])
+    pmt = _psi(PMT_PID, 0x02, b"\x00\x01\xc1\x00\x00\xe1\x00\xf0\x00" + streams)
+    packets = [pat, pmt] + _pes_packets(VIDEO_PID, 0xE0, video_es, pts, cc=pts, pcr=True)
+    if audio_bytes:
+        packets += _pes_packets(AUDIO_PID, 0xC0, os.urandom(audio_bytes), pts, cc=pts, pcr=False)
+    with open(path, "wb") as f:
+        f.write(b"".join(packets))
+
+def _pdt(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+
+def write_playlist(folder: str, entries: list, target: int = 4, media_sequence: int = 0) -> str:
+    """entries: (uri, duration, program_date_time or None)"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target}", f"#EXT-X-MEDIA-SEQUENCE:{media_sequence}"]
+    for uri, duration, pdt in entries:
+        if pdt is not None:
+            lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{_pdt(pdt)}")
+        lines += [f"#EXTINF:{duration:.6f},", uri]
+    path = os.path.join(folder, "cam.m3u8")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path)
+
+def _add_segments(folder, start, count, es=None, audio_bytes=0):
+    uris = []
+    for i in range(start, start + count):
+        uri = f"segment_{i:03d}.ts"
+        make_segment(os.path.join(folder, uri), es if es is not None else os.urandom(40000), pts=i * 360000, audio_bytes=audio_bytes)
+        uris.append(uri)
+    return uris
+
+# -----------------------
+# Tests
+# -----------------------
+def test_scan_segment_ignores_timestamps_and_audio(folder):
+    es = os.urandom(30000)
+    a, b = os.path.join(folder, "a.ts"), os.path.join(folder, "b.ts")
+    make_segment(a, es, pts=1000, audio_bytes=5000)
+    make_segment(b, es, pts=99000, audio_bytes=9000)
+    (bytes_a, digest_a), (bytes_b, digest_b) = pa.scan_segment(a), pa.scan_segment(b)
+    assert bytes_a == bytes_b == len(es)
+    assert digest_a == digest_b
+
+def test_leftover_playlist_at_launch_is_not_progress(folder):
+    now = time.time()
+    uris = _add_segments(folder, 0, 3)
+    for uri in uris:
+        os.utime(os.path.join(folder, uri), (now - 3600, now - 3600))
+    path = write_playlist(folder, [(u, 4.0, now - 3600 + i * 4) for i, u in enumerate(uris)])
+    os.utime(path, (now - 3600, now - 3600))
+
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "starting"
+    assert analyzer.last_progress is None
+    assert analyzer.pdt_drift_growth() is None
+
+    assert analyzer.check(now + pa.STARTUP_GRACE) == "stalled"
+    assert "since launch" in analyzer.reason
+
+def test_missing_playlist_within_startup_grace(folder):
+    now = time.time()
+    analyzer = pa.PlaylistAnalyzer(os.path.join(folder, "cam.m3u8"), started_at=now)
+    assert analyzer.check(now + 55) == "starting"  # ffmpeg's own RTSP timeout is 50 s
+    assert analyzer.check(now + pa.STARTUP_GRACE + 1) == "stalled"
+
+def test_constant_pdt_offset_is_healthy(folder):
+    now = time.time()
+    analyzer = pa.PlaylistAnalyzer(os.path.join(folder, "cam.m3u8"), started_at=now - 1)
+    entries = []
+    for step in range(5):
+        uri = _add_segments(folder, step, 1)[0]
+        entries.append((uri, 4.0, now + step * 4 - 40 - 4))  # 40 s behind wall clock
+        write_playlist(folder, entries)
+        assert analyzer.check(now + step * 4) == "healthy"
+    assert analyzer.status()["pdt_drift"] == pytest.approx(40, abs=0.1)
+
+def test_growing_pdt_lag_is_stalled(folder):
+    now = time.time()
+    analyzer = pa.PlaylistAnalyzer(os.path.join(folder, "cam.m3u8"), started_at=now - 1)
+    entries = []
+    for step in range(6):
+        uri = _add_segments(folder, step, 1)[0]
+        entries.append((uri, 4.0, now + step * 4 - 4))  # media advances 4 s per 20 s of wall clock
+        write_playlist(folder, entries)
+        state = analyzer.check(now + step * 20)
+    assert state == "stalled"
+    assert "behind wall clock" in analyzer.reason
+
+def test_long_segments_use_target_duration(folder):
+    now = time.time()
+    uris = _add_segments(folder, 0, 2)
+    path = write_playlist(folder, [(u, 20.0, None) for u in uris], target=20)
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "healthy"
+    assert analyzer.stall_timeout() == 60
+    assert analyzer.check(now + 25) == "healthy"
+    assert analyzer.check(now + 61) == "stalled"
+
+def test_duplicate_video_segments_are_frozen(folder):
+    now = time.time()
+    uris = _add_segments(folder, 0, 4, es=os.urandom(40000), audio_bytes=70000)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "frozen"
+    assert analyzer.frozen_streak == 3
+
+def _near_identical_frames(count: int, size: int = 40000) -> list:
+    """The same encoded picture with a few header bytes changed per frame, as a frozen camera sends it."""
+    picture = bytearray(os.urandom(size))
+    frames = []
+    for i in range(count):
+        picture[5:9] = i.to_bytes(4, "big")  # e.g. frame_num / POC in the slice header
+        frames.append(bytes(picture))
+    return frames
+
+def test_low_bitrate_against_stream_baseline_is_frozen(folder):
+    now = time.time()
+    uris = []
+    for i in range(3):
+        uris += _add_segments(folder, i, 1, es=os.urandom(400000), audio_bytes=70000)
+    for i, frame in enumerate(_near_identical_frames(3), start=3):
+        uris += _add_segments(folder, i, 1, es=frame, audio_bytes=70000)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "frozen"
+    digests = [s["digest"] for s in list(analyzer._segments)[3:]]
+    assert len(set(digests)) == 3  # not byte-identical, caught by bitrate alone
+    assert analyzer.status()["video_bitrate_baseline"] == 100000
+
+def test_low_resolution_substream_is_healthy(folder):
+    now = time.time()
+    uris = []
+    for i in range(6):
+        uris += _add_segments(folder, i, 1, es=os.urandom(8000), audio_bytes=70000)  # 2 KB/s of video
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "healthy"
+    assert analyzer.frozen_streak == 0
+
+def test_bitrate_baseline_carries_across_restarts(folder):
+    now = time.time()
+    history = deque(maxlen=pa.BITRATE_BASELINE_SEGMENTS)
+    uris = _add_segments(folder, 0, 3, es=None)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+    assert pa.PlaylistAnalyzer(path, started_at=now - 1, bitrate_history=history).check(now) == "healthy"
+    assert len(history) == 3
+
+    # Restarted ffmpeg on a camera that froze meanwhile: no healthy segment since launch
+    for uri in os.listdir(folder):
+        os.remove(os.path.join(folder, uri))
+    uris = []
+    for i, frame in enumerate(_near_identical_frames(3, size=2000)):
+        uris += _add_segments(folder, i, 1, es=frame)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+    restarted = pa.PlaylistAnalyzer(path, started_at=now - 1, bitrate_history=history)
+    assert restarted.check(now + 1) == "frozen"
+    assert len(history) == 3  # frozen segments do not drag the baseline down
+
+def test_distinct_video_segments_are_healthy(folder):
+    now = time.time()
+    uris = _add_segments(folder, 0, 4)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris])
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    assert analyzer.check(now) == "healthy"
+    assert analyzer.frozen_streak == 0
+
+def test_truncated_tail_skips_partial_entry(folder):
+    now = time.time()
+    uris = [f"segment_{i:03d}.ts" for i in range(300)]
+    for uri in uris[-5:]:
+        make_segment(os.path.join(folder, uri), os.urandom(40000), pts=0)
+    path = write_playlist(folder, [(u, 4.0, None) for u in uris], media_sequence=0)
+    assert os.path.getsize(path) > pa.PLAYLIST_TAIL_BYTES
+
+    analyzer = pa.PlaylistAnalyzer(path, started_at=now - 1)
+    entries = analyzer._parse(analyzer._read_tail())
+    assert all(duration == 4.0 for _, duration, _ in entries)
+    assert entries[-1][0] == uris[-1]
+    assert analyzer.media_sequence is None  # header is outside the tail
+
+    assert analyzer.check(now) == "healthy"
+    assert analyzer.last_segment_uri == uris[-1]
+    assert [s["uri"] for s in analyzer.status()["recent_segments"]] == uris[-5:]
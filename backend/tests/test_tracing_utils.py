@@ -0,0 +1,151 @@
+import os
+import time
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+import tracing_utils as tr
+
+@pytest.fixture
+def tracing(monkeypatch):
+    """Enable tracing and start from empty collectors."""
+    monkeypatch.setattr(tr, "TRACING_ENABLED", True)
+    monkeypatch.setattr(tr, "FIRST_SEGMENT_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(tr, "_route_histograms", {})
+    monkeypatch.setattr(tr, "_span_histograms", {})
+    monkeypatch.setattr(tr, "_first_segment_histogram", tr.LatencyHistogram())
+    monkeypatch.setattr(tr, "_first_segment_by_stream", {})
+    monkeypatch.setattr(tr, "_first_segment_waiters", {})
+
+def _wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+def _write_segment(folder: str, uri: str, mtime: float = None) -> None:
+    path = os.path.join(folder, uri)
+    with open(path, "wb") as f:
+        f.write(b"\x47" * 188)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    with open(os.path.join(folder, "cam.m3u8"), "a") as f:
+        f.write(f"#EXTINF:4.0,\n{uri}\n")
+
+# -----------------------
+# Disabled Mode
+# -----------------------
+def test_disabled_span_and_traced_are_noops(monkeypatch):
+    monkeypatch.setattr(tr, "TRACING_ENABLED", False)
+
+    def func():
+        return 1
+
+    assert tr.span("anything", x=1) is tr._NOOP_SPAN
+    assert tr.traced("anything")(func) is func
+
+def test_enabled_span_records_histogram(tracing):
+    with tr.span("work", record_id=1):
+        pass
+    with pytest.raises(ValueError):
+        with tr.span("work"):
+            raise ValueError
+
+    snapshot = tr.get_snapshot()
+    assert snapshot["spans"]["work"]["count"] == 2
+    assert snapshot["recent_spans"][-1]["error"] == "ValueError"
+
+# -----------------------
+# Histogram
+# -----------------------
+def test_histogram_buckets_are_cumulative():
+    histogram = tr.LatencyHistogram()
+    for duration_ms in (0.5, 1, 3, 40, 70000):
+        histogram.observe(duration_ms)
+
+    buckets = histogram.snapshot()["buckets"]
+    assert buckets["le_1"] == 2  # 0.5 and exactly 1
+    assert buckets["le_2"] == 2
+    assert buckets["le_5"] == 3
+    assert buckets["le_50"] == 4
+    assert buckets["le_60000"] == 4
+    assert buckets["le_inf"] == 5
+    assert histogram.snapshot()["max_ms"] == 70000
+
+# -----------------------
+# Middleware
+# -----------------------
+def _get(app, path: str) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "server": ("test", 80), "client": ("test", 1),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages[0]["status"]
+
+def test_middleware_labels_by_route_template(tracing):
+    app = FastAPI()
+    app.add_middleware(tr.RouteLatencyMiddleware)
+
+    @app.get("/records/{id}")
+    def get_record(id: int):
+        return {"id": id}
+
+    assert _get(app, "/records/1") == 200
+    assert _get(app, "/records/2") == 200
+    assert _get(app, "/nope") == 404
+
+    routes = tr.get_snapshot()["routes"]
+    assert routes["GET /records/{id}"]["count"] == 2
+    assert routes["GET <unmatched>"]["count"] == 1
+
+# -----------------------
+# Launch → First Segment
+# -----------------------
+def test_new_launch_cancels_previous_poller(tracing, tmp_path):
+    folder = str(tmp_path)
+    tr.track_first_segment("cam", folder, time.perf_counter())
+    first = tr._first_segment_waiters["cam"]
+
+    tr.track_first_segment("cam", folder, time.perf_counter())
+    assert first.is_set()
+    assert tr._first_segment_waiters["cam"] is not first
+
+    _write_segment(folder, "segment_000.ts")
+    assert _wait_until(lambda: "cam" in tr.get_snapshot()["first_segment"]["last_ms_by_stream"])
+    time.sleep(0.05)
+    assert tr.get_snapshot()["first_segment"]["histogram"]["count"] == 1
+    assert _wait_until(lambda: "cam" not in tr._first_segment_waiters)
+
+def test_leftover_segments_are_ignored(tracing, tmp_path):
+    folder = str(tmp_path)
+    _write_segment(folder, "segment_000.ts", mtime=time.time() - 3600)
+
+    tr.track_first_segment("cam", folder, time.perf_counter())
+    time.sleep(0.1)
+    assert tr.get_snapshot()["first_segment"]["histogram"]["count"] == 0
+
+    _write_segment(folder, "segment_001.ts")
+    assert _wait_until(lambda: tr.get_snapshot()["first_segment"]["histogram"]["count"] == 1)
+
+def test_unlisted_segment_does_not_stop_timer(tracing, tmp_path):
+    folder = str(tmp_path)
+    tr.track_first_segment("cam", folder, time.perf_counter())
+
+    with open(os.path.join(folder, "segment_000.ts"), "wb") as f:
+        f.write(b"\x47" * 188)  # still being written, not in the playlist yet
+    time.sleep(0.1)
+    assert tr.get_snapshot()["first_segment"]["histogram"]["count"] == 0
+    tr._first_segment_waiters["cam"].set()
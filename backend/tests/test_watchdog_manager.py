@@ -0,0 +1,48 @@
+import pytest
+
+import watchdog_manager as wd
+
+@pytest.fixture
+def history(monkeypatch):
+    monkeypatch.setattr(wd, "restart_history", {})
+    return wd._get_restart_history("/streams/cam")
+
+def test_restarts_back_off_exponentially(history):
+    now = 1000.0
+    assert wd._restart_decision(history, "stalled", now) == "restart"
+    wd._record_restart(history, now)
+
+    assert wd._restart_decision(history, "stalled", now + 15) == "wait"
+    assert wd._restart_decision(history, "stalled", now + wd.RESTART_BACKOFF_BASE) == "restart"
+    wd._record_restart(history, now + 30)
+
+    assert wd._restart_decision(history, "stalled", now + 30 + 59) == "wait"
+    assert wd._restart_decision(history, "stalled", now + 30 + 60) == "restart"
+
+def test_backoff_is_capped():
+    assert wd._restart_backoff(0) == 0
+    assert wd._restart_backoff(1) == wd.RESTART_BACKOFF_BASE
+    assert wd._restart_backoff(20) == wd.RESTART_BACKOFF_MAX
+
+def test_frozen_feed_is_only_reported_after_restart_limit(history):
+    now = 1000.0
+    for _ in range(wd.MAX_FROZEN_RESTARTS):
+        wd._record_restart(history, now)
+    now += wd.RESTART_BACKOFF_MAX
+
+    assert wd._restart_decision(history, "frozen", now) == "report"
+    assert wd._restart_decision(history, "stalled", now) == "restart"
+
+def test_restart_count_resets_after_sustained_health(history):
+    now = 1000.0
+    wd._record_restart(history, now)
+    wd._record_restart(history, now)
+
+    wd._record_health(history, True, now + 10)
+    wd._record_health(history, True, now + 100)
+    assert history["count"] == 2  # a few healthy segments after a restart are not enough
+
+    wd._record_health(history, False, now + 110)
+    wd._record_health(history, True, now + 120)
+    wd._record_health(history, True, now + 120 + wd.RESTART_RESET_AFTER)
+    assert history["count"] == 0
@@ -0,0 +1,259 @@
+import os
+import time
+import threading
+import logging
+import functools
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("stream_api")
+
+# -----------------------
+# Tracing Configuration
+# -----------------------
+# Tracing is off unless STREAM_TRACING=1. When off, span() hands back a shared
+# no-op context manager and traced() returns the function untouched.
+TRACING_ENABLED = os.getenv("STREAM_TRACING", "0") == "1"
+
+# Forward spans to OpenTelemetry as well (requires opentelemetry-sdk). If no SDK
+# TracerProvider is configured yet (e.g. by opentelemetry-instrument), one is set
+# up with an OTLP exporter, which reads the usual OTEL_EXPORTER_OTLP_* env vars.
+OTEL_ENABLED = TRACING_ENABLED and os.getenv("STREAM_TRACING_OTEL", "0") == "1"
+
+# Histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+# How many finished spans to keep for the /tracing endpoint
+RECENT_SPANS_LIMIT = 500
+
+# How long to wait for a stream's first segment before giving up
+FIRST_SEGMENT_TIMEOUT = 120  # seconds
+FIRST_SEGMENT_POLL_INTERVAL = 0.25  # seconds
+
+_NOOP_SPAN = nullcontext()
+
+def _init_otel_tracer():
+    """Return an OTel tracer backed by a real SDK provider, or None."""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+    except ImportError:
+        logger.warning("STREAM_TRACING_OTEL is set but opentelemetry-sdk is not installed; OTel export disabled")
+        return None
+
+    if not isinstance(trace.get_tracer_provider(), TracerProvider):
+        try:
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("STREAM_TRACING_OTEL is set but opentelemetry-exporter-otlp is not installed; OTel export disabled")
+            return None
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+
+    return trace.get_tracer("stream_api")
+
+_otel_tracer = _init_otel_tracer() if OTEL_ENABLED else None
+
+# -----------------------
+# Histogram
+# -----------------------
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def snapshot(self) -> dict:
+        # Cumulative counts, Prometheus-style
+        buckets, running = {}, 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.counts):
+            running += n
+            buckets[f"le_{bound}"] = running
+        buckets["le_inf"] = self.count
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets,
+        }
+
+_lock = threading.Lock()
+_route_histograms = {}
+_span_histograms = {}
+_first_segment_histogram = LatencyHistogram()
+_first_segment_by_stream = {}
+_recent_spans = deque(maxlen=RECENT_SPANS_LIMIT)
+_first_segment_waiters = {}
+
+def _observe(histograms: dict, key: str, duration_ms: float) -> None:
+    with _lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = LatencyHistogram()
+        histogram.observe(duration_ms)
+
+# -----------------------
+# Spans
+# -----------------------
+@contextmanager
+def _span(name: str, attributes: dict):
+    otel_cm = _otel_tracer.start_as_current_span(name, attributes=attributes) if _otel_tracer else nullcontext()
+    start = time.perf_counter()
+    error = None
+    with otel_cm:
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            _observe(_span_histograms, name, duration_ms)
+            with _lock:
+                _recent_spans.append({
+                    "name": name,
+                    "start": time.time() - duration_ms / 1000,
+                    "duration_ms": round(duration_ms, 3),
+                    "attributes": attributes,
+                    "error": error,
+                })
+
+def span(name: str, **attributes):
+    """Time a block of code under the given span name."""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return _span(name, attributes)
+
+def traced(name: str):
+    """Decorator form of span(); a no-op when tracing is disabled."""
+    def decorator(func):
+        if not TRACING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# -----------------------
+# Route Latency Middleware
+# -----------------------
+class RouteLatencyMiddleware:
+    """ASGI middleware recording a latency histogram per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            _observe(_route_histograms, f"{scope['method']} {path}", duration_ms)
+
+# -----------------------
+# Launch → First Segment
+# -----------------------
+def _has_segment_since(folder_path: str, since: float) -> bool:
+    """
+    True if a playlist in the folder lists a segment written at or after `since`
+    (wall clock). ffmpeg writes .ts files progressively and only adds them to the
+    playlist once complete, so this fires when the first segment is playable.
+    """
+    try:
+        playlists = [f for f in os.listdir(folder_path) if f.endswith(".m3u8")]
+    except FileNotFoundError:
+        return False
+    for playlist in playlists:
+        try:
+            with open(os.path.join(folder_path, playlist)) as f:
+                uris = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except FileNotFoundError:
+            continue
+        for uri in uris:
+            try:
+                if os.path.getmtime(os.path.join(folder_path, uri)) >= since:
+                    return True
+            except FileNotFoundError:
+                continue
+    return False
+
+def _wait_for_first_segment(stream_name: str, folder_path: str, launched_at: float, cancelled: threading.Event):
+    # Segments left over from an earlier run are older than this and are ignored
+    launched_wall = time.time() - (time.perf_counter() - launched_at)
+    deadline = launched_at + FIRST_SEGMENT_TIMEOUT
+    try:
+        while time.perf_counter() < deadline:
+            if _has_segment_since(folder_path, launched_wall):
+                duration_ms = (time.perf_counter() - launched_at) * 1000
+                with _lock:
+                    if cancelled.is_set():
+                        return
+                    _first_segment_histogram.observe(duration_ms)
+                    _first_segment_by_stream[stream_name] = round(duration_ms, 3)
+                logger.info(f"First segment for {stream_name} after {duration_ms:.0f} ms")
+                return
+            if cancelled.wait(FIRST_SEGMENT_POLL_INTERVAL):
+                return
+        logger.warning(f"No segment for {stream_name} within {FIRST_SEGMENT_TIMEOUT}s of launch")
+    finally:
+        with _lock:
+            if _first_segment_waiters.get(stream_name) is cancelled:
+                del _first_segment_waiters[stream_name]
+
+def track_first_segment(stream_name: str, folder_path: str, launched_at: float) -> None:
+    """
+    Measure time from ffmpeg launch (perf_counter) to the first playable segment.
+    A new launch of the same stream supersedes any poller still waiting.
+    """
+    if not TRACING_ENABLED:
+        return
+    cancelled = threading.Event()
+    with _lock:
+        previous = _first_segment_waiters.get(stream_name)
+        if previous is not None:
+            previous.set()
+        _first_segment_waiters[stream_name] = cancelled
+    thread = threading.Thread(
+        target=_wait_for_first_segment, args=(stream_name, folder_path, launched_at, cancelled), daemon=True
+    )
+    thread.start()
+
+# -----------------------
+# Export
+# -----------------------
+def get_snapshot() -> dict:
+    """Return all collected tracing data as a JSON-serialisable dict."""
+    with _lock:
+        return {
+            "enabled": TRACING_ENABLED,
+            "otel": _otel_tracer is not None,
+            "routes": {k: h.snapshot() for k, h in _route_histograms.items()},
+            "spans": {k: h.snapshot() for k, h in _span_histograms.items()},
+            "first_segment": {
+                "histogram": _first_segment_histogram.snapshot(),
+                "last_ms_by_stream": dict(_first_segment_by_stream),
+            },
+            "recent_spans": list(_recent_spans),
+        }
@@ -5,15 +5,40 @@ import logging
 import signal
 import subprocess
 from datetime import datetime
+from collections import deque
+from playlist_analyzer import PlaylistAnalyzer, BITRATE_BASELINE_SEGMENTS
 
 logger = logging.getLogger("stream_api")
 
 # Keep track of active watchdogs
 active_watchdogs = {}
 
-# How long to wait before considering the stream "stuck"
+# Playlist analyzers per PID, for the stream status API
+stream_analyzers = {}
+
+# How long to wait before considering the stream "stuck" (fallback when there is no playlist)
 WATCHDOG_TIMEOUT = 120  # seconds
 
+# How often the playlist is checked
+CHECK_INTERVAL = 2  # seconds
+
+# Back-to-back restarts of a stream back off exponentially: the Nth restart in a
+# row waits RESTART_BACKOFF_BASE * 2**(N-1) seconds (capped) after the previous one
+RESTART_BACKOFF_BASE = 30  # seconds
+RESTART_BACKOFF_MAX = 600  # seconds
+
+# Restarting does not fix a camera that sends a frozen picture: after this many
+# restarts in a row a frozen feed is only reported in /stream_status
+MAX_FROZEN_RESTARTS = 3
+
+# The restart count resets once the stream has been healthy this long
+RESTART_RESET_AFTER = 300  # seconds
+
+# Restart history and video bitrate baseline per stream folder; both outlive
+# the PID-keyed watchdog so they carry across restarts
+restart_history = {}
+bitrate_baselines = {}
+
 def _get_latest_mod_time(folder_path: str) -> float:
     """Return the most recent modification time of any file in folder."""
     latest_time = 0
@@ -27,26 +52,80 @@ def _get_latest_mod_time(folder_path: str) -> float:
                 continue
     return latest_time
 
-def _monitor_folder(folder_path: str, pid: int, restart_callback):
-    """Monitor a folder and restart stream if stale for too long."""
+def _get_restart_history(folder_path: str) -> dict:
+    return restart_history.setdefault(
+        folder_path, {"count": 0, "last_restart": 0.0, "healthy_since": None, "suppressed": False}
+    )
+
+def _restart_backoff(count: int) -> float:
+    """Seconds to wait after the previous restart before restart number count + 1."""
+    if count == 0:
+        return 0
+    return min(RESTART_BACKOFF_BASE * 2 ** (count - 1), RESTART_BACKOFF_MAX)
+
+def _restart_decision(history: dict, state: str, now: float) -> str:
+    """Return "restart", "wait" (backing off) or "report" (frozen, restart limit reached)."""
+    if state == "frozen" and history["count"] >= MAX_FROZEN_RESTARTS:
+        return "report"
+    if now - history["last_restart"] < _restart_backoff(history["count"]):
+        return "wait"
+    return "restart"
+
+def _record_restart(history: dict, now: float) -> None:
+    history["count"] += 1
+    history["last_restart"] = now
+    history["healthy_since"] = None
+    history["suppressed"] = False
+
+def _record_health(history: dict, healthy: bool, now: float) -> None:
+    if not healthy:
+        history["healthy_since"] = None
+        return
+    history["suppressed"] = False
+    if history["healthy_since"] is None:
+        history["healthy_since"] = now
+    elif now - history["healthy_since"] >= RESTART_RESET_AFTER:
+        history["count"] = 0
+
+def _monitor_folder(folder_path: str, pid: int, analyzer: PlaylistAnalyzer, restart_callback):
+    """Monitor a stream's playlist and restart the stream, with backoff, if it stalls or freezes."""
     logger.info(f"Watchdog started for PID {pid}, folder: {folder_path}")
-    last_active = time.time()
+    history = _get_restart_history(folder_path)
 
     while pid in active_watchdogs:
         try:
-            latest_mod = _get_latest_mod_time(folder_path)
+            analyzer.check()
             now = time.time()
 
-            # If no updates in 2 minutes → restart stream
-            if latest_mod > 0 and (now - latest_mod) > WATCHDOG_TIMEOUT:
-                logger.warning(f"No updates in {WATCHDOG_TIMEOUT}s for {folder_path}. Restarting PID {pid}...")
-                restart_callback(pid)
-                break
+            # Playlist stopped advancing or the feed is frozen
+            problem = None
+            state = analyzer.state
+            if analyzer.unhealthy:
+                problem = f"Stream {state} for {folder_path} ({analyzer.reason})"
+            else:
+                # Fallback: if nothing in the folder changed in 2 minutes
+                latest_mod = _get_latest_mod_time(folder_path)
+                if latest_mod > 0 and (now - latest_mod) > WATCHDOG_TIMEOUT:
+                    problem, state = f"No updates in {WATCHDOG_TIMEOUT}s for {folder_path}", "stalled"
+
+            if problem is None:
+                _record_health(history, state == "healthy", now)
+            else:
+                _record_health(history, False, now)
+                decision = _restart_decision(history, state, now)
+                if decision == "restart":
+                    logger.warning(f"{problem}. Restarting PID {pid} (restart {history['count'] + 1} in a row)...")
+                    _record_restart(history, now)
+                    restart_callback(pid)
+                    break
+                if decision == "report" and not history["suppressed"]:
+                    logger.warning(f"{problem}. Not restarting PID {pid}: {history['count']} restarts in a row did not help")
+                    history["suppressed"] = True
 
-            time.sleep(10)  # check every 10 seconds
+            time.sleep(CHECK_INTERVAL)
         except Exception as e:
             logger.error(f"Watchdog error for PID {pid}: {e}")
-            time.sleep(10)
+            time.sleep(CHECK_INTERVAL)
 
     logger.info(f"Watchdog stopped for PID {pid}")
 
@@ -56,7 +135,10 @@ def start_watchdog(pid: int, folder_path: str, restart_callback):
         logger.warning(f"Watchdog already running for PID {pid}")
         return
 
-    thread = threading.Thread(target=_monitor_folder, args=(folder_path, pid, restart_callback), daemon=True)
+    playlist_path = os.path.join(folder_path, f"{os.path.basename(folder_path)}.m3u8")
+    baseline = bitrate_baselines.setdefault(folder_path, deque(maxlen=BITRATE_BASELINE_SEGMENTS))
+    analyzer = stream_analyzers[pid] = PlaylistAnalyzer(playlist_path, bitrate_history=baseline)
+    thread = threading.Thread(target=_monitor_folder, args=(folder_path, pid, analyzer, restart_callback), daemon=True)
     active_watchdogs[pid] = thread
     thread.start()
 
@@ -65,3 +147,17 @@ def stop_watchdog(pid: int):
     if pid in active_watchdogs:
         logger.info(f"Stopping watchdog for PID {pid}")
         del active_watchdogs[pid]
+    stream_analyzers.pop(pid, None)
+
+def get_stream_status(pid: int):
+    """Return the latest playlist analysis and restart state for a PID, or None if it is not monitored."""
+    analyzer = stream_analyzers.get(pid)
+    if not analyzer:
+        return None
+    status = analyzer.status()
+    history = _get_restart_history(analyzer.folder_path)
+    status["restarts_in_a_row"] = history["count"]
+    status["restart_suppressed"] = history["suppressed"]
+    next_restart = history["last_restart"] + _restart_backoff(history["count"]) - time.time()
+    status["restart_backoff_remaining"] = round(max(next_restart, 0), 1)
+    return status